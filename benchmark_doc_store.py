@@ -0,0 +1,141 @@
+# benchmark_doc_store.py
+"""Resident memory of the document loading path, before and after the store.
+
+Builds a synthetic catalog, then loads it in a fresh process per layout:
+
+- legacy: the old load_documents (Document list + by_id dict) plus
+  FAISS.load_local of a save_local folder, which unpickles every page again
+- store:  load_documents/get_or_build_index as the app runs them, i.e.
+  DocumentStore + load_or_build_vector_index on the faiss-only folder
+
+Embeddings are deterministic hash vectors so no model is loaded; the faiss
+index has the same shape (384 dims) as all-MiniLM-L6-v2.
+
+Usage: python benchmark_doc_store.py [n_movies]
+"""
+import gc
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import zlib
+from typing import List
+
+import numpy as np
+import pandas as pd
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+from doc_store import DocumentStore, build_doc_store, load_or_build_vector_index, store_is_stale
+
+DIM = 384
+
+
+class HashEmbeddings(Embeddings):
+    def _embed(self, text: str) -> List[float]:
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        return rng.standard_normal(DIM, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def memory_mb() -> dict:
+    """Current (VmRSS) and peak (VmHWM) resident memory in MB."""
+    out = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key = line.split(":")[0]
+            if key in ("VmRSS", "VmHWM"):
+                out[key] = int(line.split()[1]) / 1024
+    return out
+
+
+def write_synthetic_csv(csv_path: str, n_movies: int, reviews_per_movie: int = 40) -> None:
+    rng = random.Random(0)
+    words = ("great boring plot acting slow music story director camera scene ending "
+             "brilliant dull classic remake sequel villain hero score pacing").split()
+    rows = []
+    for i in range(n_movies):
+        reviews = "\n\n".join(
+            f"Reviewer: User {rng.randint(0, 5000)} (user{rng.randint(0, 5000)}@example.com)\n"
+            f"Review: {' '.join(rng.choices(words, k=rng.randint(20, 60)))}"
+            for _ in range(reviews_per_movie))
+        rows.append({"movie_id": f"{i:024x}", "document": (
+            f"EmbeddedStatus: Not Embedded\nTitle: Movie {i}\nYear: {1900 + i % 120}\n"
+            f"Plot: {' '.join(rng.choices(words, k=40))}\nReviews:\n{reviews}")})
+    pd.DataFrame(rows).to_csv(csv_path, index=False)
+
+
+def legacy_load_documents(csv_path: str):
+    """load_documents as it was before the document store."""
+    df = pd.read_csv(csv_path)
+    docs: List[Document] = []
+    by_id = {}
+    for _, row in df.iterrows():
+        movie_id = str(row["movie_id"])
+        content = str(row["document"])
+        m = re.search(r"^Title:\s*(.+)$", content, flags=re.MULTILINE)
+        doc = Document(page_content=content, metadata={"movie_id": movie_id, "title": m.group(1).strip() if m else ""})
+        docs.append(doc)
+        by_id[movie_id] = doc
+    return docs, by_id
+
+
+def measure(mode: str, tmp: str) -> None:
+    csv_path = os.path.join(tmp, "docs.csv")
+    dependable_faiss_import()  # count only data, not the faiss library itself
+    before = memory_mb()
+    if mode == "legacy":
+        docs, by_id = legacy_load_documents(csv_path)
+        vs = FAISS.load_local(os.path.join(tmp, "legacy_index"), HashEmbeddings(),
+                              allow_dangerous_deserialization=True)
+    else:
+        store_path = os.path.join(tmp, "store_" + mode)
+        assert not store_is_stale(csv_path, store_path)
+        by_id = DocumentStore(store_path)
+        docs = by_id.documents()
+        vs = load_or_build_vector_index(os.path.join(tmp, "index_" + mode), HashEmbeddings(), by_id)
+    for q in ("boring villain", "classic remake", "slow pacing"):
+        vs.similarity_search(q, k=5)
+    gc.collect()
+    after = memory_mb()
+    print(f"{mode:>16}: +{after['VmRSS'] - before['VmRSS']:.0f} MB resident, "
+          f"peak +{after['VmHWM'] - before['VmHWM']:.0f} MB ({len(docs)} documents)")
+
+
+def main(n_movies: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "docs.csv")
+        write_synthetic_csv(csv_path, n_movies)
+        print(f"Synthetic catalog: {n_movies} documents, {os.path.getsize(csv_path) / 2**20:.0f} MB CSV")
+
+        docs, _ = legacy_load_documents(csv_path)
+        FAISS.from_documents(docs, HashEmbeddings()).save_local(os.path.join(tmp, "legacy_index"))
+        del docs
+        pkl = os.path.join(tmp, "legacy_index", "index.pkl")
+        print(f"Legacy index.pkl: {os.path.getsize(pkl) / 2**20:.0f} MB")
+
+        for compress in (False, True):
+            mode = "store_zlib" if compress else "store_raw"
+            store_path = os.path.join(tmp, "store_" + mode)
+            build_doc_store(csv_path, store_path, compress=compress)
+            load_or_build_vector_index(os.path.join(tmp, "index_" + mode), HashEmbeddings(), DocumentStore(store_path))
+            print(f"{mode} blob: {os.path.getsize(store_path + '.blob') / 2**20:.0f} MB")
+
+        for mode in ("legacy", "store_raw", "store_zlib"):
+            subprocess.run([sys.executable, __file__, "--measure", mode, tmp], check=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
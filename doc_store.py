@@ -0,0 +1,275 @@
+# doc_store.py
+import hashlib
+import json
+import mmap
+import os
+import zlib
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterator, List, Optional, Union
+
+import pandas as pd
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+FAISS_FILE = "index.faiss"
+IDS_FILE = "movie_ids.json"
+HASH_FILE = "content_hash.txt"
+LEGACY_PICKLE = "index.pkl"
+
+
+def extract_title(text: str) -> str:
+    for line in text.splitlines():
+        if line.startswith("Title:"):
+            return line[len("Title:"):].strip()
+    return ""
+
+
+def _hash_record(h, movie_id: str, data: bytes) -> None:
+    h.update(movie_id.encode("utf-8") + b"\0" + len(data).to_bytes(8, "little") + data)
+
+
+# ----------------------------
+# Build
+# ----------------------------
+def build_doc_store(csv_path: str, store_path: str, compress: bool = True,
+                    chunksize: int = 2000) -> None:
+    """Write the documents CSV into `<store_path>.blob` plus `<store_path>.idx`.
+
+    The blob is every record back to back (zlib-compressed when `compress`),
+    the index holds the offset table, movie ids, titles and a hash of the ids
+    and uncompressed text. The CSV is read in chunks so building never holds
+    the whole catalog in memory.
+    """
+    h = hashlib.sha256()
+    offsets = array("Q", [0])
+    ids: List[str] = []
+    titles: List[str] = []
+    tmp_blob = store_path + ".blob.tmp"
+    with open(tmp_blob, "wb") as out:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            for movie_id, content in zip(chunk["movie_id"], chunk["document"]):
+                text = str(content)
+                data = text.encode("utf-8")
+                _hash_record(h, str(movie_id), data)
+                if compress:
+                    data = zlib.compress(data)
+                out.write(data)
+                offsets.append(offsets[-1] + len(data))
+                ids.append(str(movie_id))
+                titles.append(extract_title(text))
+
+    tmp_idx = store_path + ".idx.tmp"
+    with open(tmp_idx, "wb") as out:
+        header = json.dumps({"compressed": compress, "ids": ids, "titles": titles,
+                             "content_hash": h.hexdigest()}).encode("utf-8")
+        out.write(len(header).to_bytes(8, "little"))
+        out.write(header)
+        offsets.tofile(out)
+    os.replace(tmp_blob, store_path + ".blob")
+    os.replace(tmp_idx, store_path + ".idx")
+
+
+def store_is_stale(csv_path: str, store_path: str) -> bool:
+    paths = [store_path + ".blob", store_path + ".idx"]
+    if not all(os.path.exists(p) for p in paths):
+        return True
+    return min(os.path.getmtime(p) for p in paths) < os.path.getmtime(csv_path)
+
+
+# ----------------------------
+# Read
+# ----------------------------
+class DocumentStore(Mapping):
+    """Read-only movie_id -> Document mapping over a memory-mapped blob.
+
+    Only the offset table, ids and titles are held in Python objects; page
+    text stays in the mapped file and is decoded into a fresh Document on each
+    lookup, so nothing keeps a second copy of it alive.
+    """
+
+    def __init__(self, store_path: str):
+        with open(store_path + ".idx", "rb") as f:
+            header_len = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_len).decode("utf-8"))
+            self.offsets = array("Q")
+            self.offsets.frombytes(f.read())
+        self.compressed: bool = header["compressed"]
+        self.ids: List[str] = header["ids"]
+        self.titles: List[str] = header["titles"]
+        self.slots: Dict[str, int] = {movie_id: i for i, movie_id in enumerate(self.ids)}
+
+        self._file = open(store_path + ".blob", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        # Stores written before the hash was recorded compute it once here
+        self.content_hash: str = header.get("content_hash") or self._compute_hash()
+
+    def _compute_hash(self) -> str:
+        h = hashlib.sha256()
+        for slot, movie_id in enumerate(self.ids):
+            _hash_record(h, movie_id, self.text_at(slot).encode("utf-8"))
+        return h.hexdigest()
+
+    def text_at(self, slot: int) -> str:
+        data = self._blob[self.offsets[slot]:self.offsets[slot + 1]]
+        if self.compressed:
+            data = zlib.decompress(data)
+        return data.decode("utf-8")
+
+    def doc_at(self, slot: int) -> Document:
+        return Document(page_content=self.text_at(slot),
+                        metadata={"movie_id": self.ids[slot], "title": self.titles[slot]})
+
+    def __getitem__(self, movie_id: str) -> Document:
+        return self.doc_at(self.slots[movie_id])
+
+    def __contains__(self, movie_id) -> bool:
+        return movie_id in self.slots
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def documents(self) -> "StoreDocuments":
+        return StoreDocuments(self)
+
+    def close(self) -> None:
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+
+
+class StoreDocuments(Sequence):
+    """List-like view of a DocumentStore in catalog order."""
+
+    def __init__(self, store: DocumentStore):
+        self.store = store
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.store.doc_at(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.store.doc_at(i)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+
+class StoreDocstore(Docstore):
+    """FAISS docstore that resolves ids through a DocumentStore."""
+
+    def __init__(self, store: DocumentStore):
+        self.store = store
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search not in self.store:
+            return f"ID {search} not found."
+        return self.store[search]
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise ValueError("StoreDocstore is read-only; rebuild the document store instead.")
+
+    def delete(self, ids: List) -> None:
+        raise ValueError("StoreDocstore is read-only; rebuild the document store instead.")
+
+
+# ----------------------------
+# Vector index
+# ----------------------------
+def save_vector_index(vs: FAISS, index_dir: str, content_hash: str) -> None:
+    """Save only the faiss index, its row -> movie_id order and the store hash.
+
+    Unlike FAISS.save_local nothing here pickles the documents; the text is
+    served from the DocumentStore when the index is loaded. The hash records
+    which text the vectors were computed from.
+    """
+    faiss = dependable_faiss_import()
+    os.makedirs(index_dir, exist_ok=True)
+    ids = [vs.index_to_docstore_id[row] for row in range(len(vs.index_to_docstore_id))]
+    faiss.write_index(vs.index, os.path.join(index_dir, FAISS_FILE))
+    with open(os.path.join(index_dir, IDS_FILE), "w") as f:
+        json.dump(ids, f)
+    with open(os.path.join(index_dir, HASH_FILE), "w") as f:
+        f.write(content_hash)
+
+
+def build_vector_index(store: DocumentStore, embeddings: Embeddings, batch_size: int = 256) -> FAISS:
+    """Embed the store batch by batch into a flat L2 index (FAISS's default)."""
+    import numpy as np
+    faiss = dependable_faiss_import()
+    index = None
+    for start in range(0, len(store), batch_size):
+        texts = [store.text_at(i) for i in range(start, min(start + batch_size, len(store)))]
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        if index is None:
+            index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+    return FAISS(embeddings, index, StoreDocstore(store), dict(enumerate(store.ids)))
+
+
+def load_vector_index(index_dir: str, embeddings: Embeddings, store: DocumentStore) -> Optional[FAISS]:
+    """Load an index saved by save_vector_index, or None if it does not match the store.
+
+    Matching means the same ids in the same order and the same content hash,
+    so a store rebuilt with new text for the same movies is re-embedded.
+    """
+    ids_path = os.path.join(index_dir, IDS_FILE)
+    hash_path = os.path.join(index_dir, HASH_FILE)
+    if not (os.path.exists(ids_path) and os.path.exists(hash_path)):
+        return None
+    with open(hash_path) as f:
+        if f.read().strip() != store.content_hash:
+            return None
+    with open(ids_path) as f:
+        ids = json.load(f)
+    if ids != store.ids:
+        return None
+    faiss = dependable_faiss_import()
+    index = faiss.read_index(os.path.join(index_dir, FAISS_FILE))
+    return FAISS(embeddings, index, StoreDocstore(store), dict(enumerate(ids)))
+
+
+def migrate_legacy_index(index_dir: str, embeddings: Embeddings, store: DocumentStore) -> Optional[FAISS]:
+    """Convert a FAISS.save_local folder to the store-backed layout, once.
+
+    Rows are re-keyed to movie ids from each pickled document's metadata, the
+    new layout is written, and the pickle with the duplicate text is removed.
+    """
+    if not os.path.exists(os.path.join(index_dir, LEGACY_PICKLE)):
+        return None
+    vs = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    remapped: Dict[int, str] = {}
+    for row, doc_id in vs.index_to_docstore_id.items():
+        doc = vs.docstore.search(doc_id)
+        # Only reuse vectors whose pickled text is what the store holds now
+        if (not isinstance(doc, Document) or doc.metadata.get("movie_id") not in store
+                or store[doc.metadata["movie_id"]].page_content != doc.page_content):
+            return None
+        remapped[row] = doc.metadata["movie_id"]
+    vs.index_to_docstore_id = remapped
+    vs.docstore = StoreDocstore(store)
+    save_vector_index(vs, index_dir, store.content_hash)
+    os.remove(os.path.join(index_dir, LEGACY_PICKLE))
+    return vs
+
+
+def load_or_build_vector_index(index_dir: str, embeddings: Embeddings, store: DocumentStore) -> FAISS:
+    vs = load_vector_index(index_dir, embeddings, store)
+    if vs is None:
+        vs = migrate_legacy_index(index_dir, embeddings, store)
+    if vs is None:
+        vs = build_vector_index(store, embeddings)
+        save_vector_index(vs, index_dir, store.content_hash)
+        legacy = os.path.join(index_dir, LEGACY_PICKLE)
+        if os.path.exists(legacy):
+            os.remove(legacy)
+    return vs
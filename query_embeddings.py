@@ -0,0 +1,194 @@
+# query_embeddings.py
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain.embeddings.base import Embeddings
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: lowercased with whitespace collapsed."""
+    return _WS.sub(" ", text.lower()).strip()
+
+
+class _Pending:
+    """One query waiting for the next batched encode."""
+
+    def __init__(self, key: str, text: str):
+        self.key = key
+        self.text = text  # the first caller's query, sent to the model as-is
+        self.done = threading.Event()
+        # Set when the result is ready or when a waiter is asked to lead
+        self.wake = threading.Event()
+        self.promoted = False
+        self.claimed = False
+        self.vector: Optional[List[float]] = None
+        self.error: Optional[BaseException] = None
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Wraps an embedder with an LRU cache and micro-batching for queries.
+
+    Queries are normalized (lowercased, whitespace collapsed) for lookup, so
+    repeated sidebar questions and re-asked questions skip the encoder
+    entirely. The model still sees the first caller's original text; with a
+    cased model, queries differing only in case share that first vector. On a miss the caller joins a
+    pending batch; the first caller waits `batch_window` seconds for others to
+    arrive, then encodes one batch with a single `embed_documents` call and
+    returns. If queries are still pending, a caller waiting on one of them is
+    woken to encode the next batch, so no caller works past its own answer.
+    Document embedding is passed straight through to the base embedder.
+    """
+
+    def __init__(self, base: Embeddings, max_size: int = 1024,
+                 batch_window: float = 0.005, max_batch: int = 32):
+        self.base = base
+        self.max_size = max_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._pending: "OrderedDict[str, _Pending]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._leader_active = False
+
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0  # misses that shared an encode already pending
+        self.encode_calls = 0
+        self.encoded_queries = 0
+        self.encode_seconds = 0.0
+
+    # ---- Embeddings interface ----
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        with self._lock:
+            vec = self._cache.get(key)
+            if vec is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return vec
+            item = self._pending.get(key)
+            if item is None:
+                self.misses += 1
+                item = _Pending(key, text)
+                self._pending[key] = item
+            else:
+                self.joined += 1
+            lead = not self._leader_active
+            if lead:
+                self._leader_active = True
+                item.promoted = item.claimed = True
+
+        if lead:
+            self._run_batch(wait=True)
+        else:
+            item.wake.wait()
+            if not item.done.is_set():
+                with self._lock:
+                    lead = item.promoted and not item.claimed
+                    item.claimed = True
+                if lead:
+                    self._run_batch(wait=False)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.vector
+
+    # ---- Batching ----
+    def _run_batch(self, wait: bool) -> None:
+        """Encode one batch, then hand leadership to the next pending query.
+
+        The leader's own query is always the oldest pending one, so it is in
+        the batch it encodes.
+        """
+        if wait:
+            time.sleep(self.batch_window)
+        with self._lock:
+            batch: List[_Pending] = []
+            while self._pending and len(batch) < self.max_batch:
+                _, item = self._pending.popitem(last=False)
+                batch.append(item)
+        try:
+            self._encode(batch)
+        finally:
+            with self._lock:
+                if self._pending:
+                    nxt = next(iter(self._pending.values()))
+                    nxt.promoted = True
+                    nxt.wake.set()
+                else:
+                    self._leader_active = False
+
+    def _encode(self, batch: List[_Pending]) -> None:
+        try:
+            self._encode_group(batch)
+        except Exception:
+            if len(batch) == 1:
+                self._fail(batch)
+                return
+            # One bad query should not fail the others it was batched with
+            for p in batch:
+                try:
+                    self._encode_group([p])
+                except Exception:
+                    self._fail([p])
+        except BaseException:
+            self._fail(batch)
+            raise
+
+    def _encode_group(self, group: List[_Pending]) -> None:
+        start = time.perf_counter()
+        vectors = self.base.embed_documents([p.text for p in group])
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.encode_calls += 1
+            self.encoded_queries += len(group)
+            self.encode_seconds += elapsed
+            for p, vec in zip(group, vectors):
+                p.vector = vec
+                self._cache[p.key] = vec
+                self._cache.move_to_end(p.key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        for p in group:
+            p.done.set()
+            p.wake.set()
+
+    def _fail(self, group: List[_Pending]) -> None:
+        exc = sys.exc_info()[1]
+        for p in group:
+            p.error = exc
+            p.done.set()
+            p.wake.set()
+
+    # ---- Reporting ----
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.joined + self.misses
+            return {
+                "cache_size": len(self._cache),
+                "lookups": lookups,
+                "hits": self.hits,
+                "joined": self.joined,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                # Share of lookups that did not need an encode of their own
+                "saved_rate": (self.hits + self.joined) / lookups if lookups else 0.0,
+                "encode_calls": self.encode_calls,
+                "avg_batch_size": self.encoded_queries / self.encode_calls if self.encode_calls else 0.0,
+                "avg_encode_ms": 1000 * self.encode_seconds / self.encode_calls if self.encode_calls else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,398 @@
+# review_index.py
+import heapq
+import importlib.util
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+import pandas as pd
+
+CONNECT_TIMEOUT = 3  # seconds; a refresh must never hold up answers for long
+NO_DATE = -(2 ** 63)  # sorts before every real date and never wins "latest"
+
+TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [t.strip("'") for t in TOKEN.findall(str(text).lower()) if t.strip("'")]
+
+
+def _norm(text) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+def _contains_run(tokens: List[str], run: List[str]) -> bool:
+    k = len(run)
+    return any(tokens[i:i + k] == run for i in range(len(tokens) - k + 1))
+
+
+def format_date(ts: int) -> str:
+    if ts == NO_DATE:
+        return "unknown date"
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+class ReviewIndex:
+    """Aggregates and an inverted index over the comments/users join.
+
+    Every comment gets a position; per-comment movie slot, user slot and date
+    live in parallel typed arrays. Per-movie and per-user counts and latest
+    dates live in arrays indexed by slot, and each token maps to an ascending
+    array of comment positions. `add_comment` updates all of it in place, so
+    new comments can be appended without a rebuild; comment ids already
+    indexed are skipped, which makes re-reading an overlapping range safe.
+    Slots are registered in the lookup dicts only after their arrays have
+    grown, so readers never see a slot without its data.
+    """
+
+    def __init__(self):
+        self.movie_ids: List[str] = []
+        self.movie_slots: Dict[str, int] = {}
+        self.movie_counts = array("I")
+        self.movie_latest = array("q")
+
+        self.user_emails: List[str] = []
+        self.user_names: List[str] = []
+        self.user_slots: Dict[str, int] = {}
+        self.users_by_name: Dict[str, List[int]] = {}
+        self.user_counts = array("I")
+        self.user_latest = array("q")
+        self.user_comments: List[array] = []
+
+        self.comment_movie = array("I")
+        self.comment_user = array("I")
+        self.comment_date = array("q")
+        self.comment_text: List[str] = []
+        self.postings: Dict[str, array] = {}
+        self.comment_ids: Set[str] = set()
+        self.latest_date: Optional[int] = None
+
+        self.lock = threading.Lock()  # serializes updates, not reads
+        self.refreshed_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.comment_text)
+
+    # ---- Updates ----
+    def _movie_slot(self, movie_id: str) -> int:
+        slot = self.movie_slots.get(movie_id)
+        if slot is None:
+            slot = len(self.movie_ids)
+            self.movie_ids.append(movie_id)
+            self.movie_counts.append(0)
+            self.movie_latest.append(NO_DATE)
+            self.movie_slots[movie_id] = slot
+        return slot
+
+    def _user_slot(self, email: str, name: str) -> int:
+        key = _norm(email)
+        slot = self.user_slots.get(key)
+        if slot is None:
+            slot = len(self.user_emails)
+            self.user_emails.append(email)
+            self.user_names.append(name)
+            self.user_counts.append(0)
+            self.user_latest.append(NO_DATE)
+            self.user_comments.append(array("I"))
+            self.user_slots[key] = slot
+            self.users_by_name.setdefault(_norm(name), []).append(slot)
+        return slot
+
+    def add_comment(self, movie_id: str, email: str, name: str, text: str, date: int = NO_DATE,
+                    comment_id: Optional[str] = None) -> Optional[int]:
+        """Add one comment (date in epoch seconds) and return its position.
+
+        Returns None if `comment_id` is already indexed.
+        """
+        if comment_id is not None:
+            if comment_id in self.comment_ids:
+                return None
+            self.comment_ids.add(comment_id)
+        pos = len(self.comment_text)
+        m = self._movie_slot(str(movie_id))
+        u = self._user_slot(str(email), str(name))
+
+        self.comment_movie.append(m)
+        self.comment_user.append(u)
+        self.comment_date.append(date)
+        self.comment_text.append(str(text))
+
+        self.movie_counts[m] += 1
+        self.movie_latest[m] = max(self.movie_latest[m], date)
+        self.user_counts[u] += 1
+        self.user_latest[u] = max(self.user_latest[u], date)
+        self.user_comments[u].append(pos)
+        if date != NO_DATE and (self.latest_date is None or date > self.latest_date):
+            self.latest_date = date
+
+        for token in set(tokenize(text)):
+            plist = self.postings.get(token)
+            if plist is None:
+                plist = self.postings[token] = array("I")
+            plist.append(pos)
+        return pos
+
+    def add_frame(self, df: pd.DataFrame) -> int:
+        """Add rows from a comments frame (_id, movie_id, email, name, text, date).
+
+        Returns how many comments were new.
+        """
+        dates = pd.to_datetime(df["date"], format="ISO8601", errors="coerce", utc=True)
+        added = 0
+        rows = zip(df["_id"], df["movie_id"], df["email"], df["name"], df["text"], dates)
+        for comment_id, movie_id, email, name, text, date in rows:
+            ts = int(date.timestamp()) if pd.notna(date) else NO_DATE
+            name = name if pd.notna(name) else "Anonymous"
+            text = text if pd.notna(text) else ""
+            if self.add_comment(movie_id, email, name, text, ts, comment_id=str(comment_id)) is not None:
+                added += 1
+        return added
+
+    # ---- Queries ----
+    def _top(self, counts: array, n: int) -> List[int]:
+        return heapq.nlargest(n, range(len(counts)), key=counts.__getitem__)
+
+    def most_reviewed(self, n: int = 10) -> List[Tuple[str, int, int]]:
+        """(movie_id, count, latest_date) for the n most-commented movies."""
+        return [(self.movie_ids[s], self.movie_counts[s], self.movie_latest[s])
+                for s in self._top(self.movie_counts, n)]
+
+    def most_active_users(self, n: int = 10) -> List[Tuple[str, str, int, int]]:
+        """(name, email, count, latest_date) for the n most active reviewers."""
+        return [(self.user_names[s], self.user_emails[s], self.user_counts[s], self.user_latest[s])
+                for s in self._top(self.user_counts, n)]
+
+    def movie_stats(self, movie_id: str) -> Optional[Tuple[int, int]]:
+        slot = self.movie_slots.get(movie_id)
+        return None if slot is None else (self.movie_counts[slot], self.movie_latest[slot])
+
+    def find_users(self, who: str) -> List[int]:
+        key = _norm(who)
+        if key in self.user_slots:
+            return [self.user_slots[key]]
+        return list(self.users_by_name.get(key, []))
+
+    def reviews_by_user(self, who: str, n: int = 10) -> List[int]:
+        """Positions of the user's n latest comments (matched by email or name)."""
+        hits = [pos for slot in self.find_users(who) for pos in self.user_comments[slot]]
+        return heapq.nlargest(n, hits, key=self.comment_date.__getitem__)
+
+    def matching(self, text: str) -> List[int]:
+        """Positions of comments containing `text` as a run of adjacent tokens.
+
+        The postings narrow it down to comments holding every token; for
+        multi-word phrases the stored text is then checked for adjacency.
+        """
+        tokens = tokenize(text)
+        if not tokens:
+            return []
+        lists = sorted((self.postings.get(t, array("I")) for t in set(tokens)), key=len)
+        hits = set(lists[0])
+        for plist in lists[1:]:
+            if not hits:
+                break
+            hits.intersection_update(plist)
+        if len(tokens) > 1:
+            hits = {pos for pos in hits if _contains_run(tokenize(self.comment_text[pos]), tokens)}
+        return list(hits)
+
+    def search(self, text: str, n: int = 10) -> List[int]:
+        """The n latest comments mentioning `text`."""
+        return heapq.nlargest(n, self.matching(text), key=self.comment_date.__getitem__)
+
+    def movies_mentioning(self, text: str, n: int = 10) -> List[Tuple[str, int]]:
+        """(movie_id, matching_comments) for the n movies most often mentioning `text`."""
+        counts = Counter(self.comment_movie[pos] for pos in self.matching(text))
+        return [(self.movie_ids[slot], c) for slot, c in counts.most_common(n)]
+
+
+# ----------------------------
+# Loading
+# ----------------------------
+def join_comments_users(df_comments: pd.DataFrame, df_users: pd.DataFrame) -> pd.DataFrame:
+    users = df_users[["email", "name"]].drop_duplicates("email").rename(columns={"name": "user_name"})
+    df = df_comments.merge(users, on="email", how="left")
+    # Prefer the users table name, fall back to the name stored on the comment
+    df["name"] = df["user_name"].fillna(df["name"]) if "name" in df.columns else df["user_name"]
+    return df[["_id", "movie_id", "email", "name", "text", "date"]]
+
+
+def load_review_index(comments_csv: str, users_csv: str) -> ReviewIndex:
+    df = join_comments_users(pd.read_csv(comments_csv), pd.read_csv(users_csv, usecols=["name", "email"]))
+    index = ReviewIndex()
+    index.add_frame(df.sort_values("date", kind="stable"))
+    return index
+
+
+COMMENTS_QUERY = """
+SELECT c._id, c.movie_id, c.email, COALESCE(u.name, c.name) AS name, c.text, c.date
+FROM comments c
+LEFT JOIN users u ON c.email = u.email
+"""
+
+
+def load_review_index_from_db() -> ReviewIndex:
+    index = ReviewIndex()
+    update_from_db(index)
+    return index
+
+
+def _fetch_new(index: ReviewIndex) -> int:
+    import psycopg2
+    from prepare_doc import db_params
+
+    conn = psycopg2.connect(**db_params, connect_timeout=CONNECT_TIMEOUT)
+    cur = conn.cursor()
+    query = COMMENTS_QUERY
+    params: tuple = ()
+    if index.latest_date is not None:
+        query += " WHERE c.date::timestamptz >= to_timestamp(%s)"
+        params = (index.latest_date,)
+    cur.execute(query + " ORDER BY c.date;", params)
+    colnames = [desc[0] for desc in cur.description]
+    df = pd.DataFrame(cur.fetchall(), columns=colnames)
+    cur.close()
+    conn.close()
+    return index.add_frame(df)
+
+
+def update_from_db(index: ReviewIndex) -> int:
+    """Append comments from Postgres that are not indexed yet.
+
+    Reads everything dated at or after the newest indexed comment (whole
+    seconds, so rounding can only widen the range) and lets the comment id
+    check drop rows already seen. Returns how many comments were added.
+    """
+    with index.lock:
+        index.refreshed_at = time.time()
+        return _fetch_new(index)
+
+
+def refresh_if_stale(index: ReviewIndex, max_age: float) -> int:
+    """Pull new comments from Postgres at most once every max_age seconds.
+
+    The attempt time is recorded before connecting, so a database that is
+    down is retried once per max_age rather than on every question. Does
+    nothing when max_age <= 0 or psycopg2 is not installed (CSV-only runs),
+    and skips instead of waiting when another session is already refreshing.
+    """
+    if max_age <= 0 or importlib.util.find_spec("psycopg2") is None:
+        return 0
+    if time.time() - index.refreshed_at < max_age:
+        return 0
+    if not index.lock.acquire(blocking=False):
+        return 0
+    try:
+        index.refreshed_at = time.time()
+        return _fetch_new(index)
+    finally:
+        index.lock.release()
+
+
+# ----------------------------
+# Question answering
+# ----------------------------
+TOP_N = re.compile(r"\b(?:top|most)\s+(\d+)\b|\b(\d+)\s+most\b")
+MOST_REVIEWED = re.compile(r"\bmost\s+(?:reviewed|commented)\b|\bmost\s+(?:reviews|comments)\b")
+ACTIVE_USERS = re.compile(r"\b(?:most\s+active|top)(?:\s+\d+)?\s+(?:reviewers|commenters|users)\b|\bwho\s+(?:reviewed|commented)\s+the\s+most\b")
+MENTIONING = re.compile(
+    r"\b(?:reviews?|comments?)\s+(?:that\s+)?(?:mentioning|mention|mentions|containing|contain|contains|with\s+the\s+word)\s+"
+    r"[\"']?(.+?)[\"']?\s*[?.!]*$")
+WHICH_MOVIES = re.compile(r"^(?:which|what|list)?\s*(?:the\s+)?movies\b")
+
+# Words the aggregate answers can absorb. Anything else in the question (a
+# year, genre, term, ...) is a filter they can't apply, so retrieval gets it.
+AGGREGATE_WORDS = set("""
+a all are by data dataset did do ever film films give has have having in is list me most movie movies
+number of on show tell the top what which who whose with
+reviewed commented review reviews comment comments received got
+active reviewers reviewer commenters commenter users user wrote written
+""".split())
+BY_USER = re.compile(
+    r"\bwhat\s+(?:did|has)\s+(.+?)\s+(?:review|reviewed|comment|commented)(?:\s+on)?\b"
+    r"|\b(?:reviews?|comments?)\s+(?:by|from|written\s+by)\s+(.+?)\s*[?.!]*$")
+
+MAX_SNIPPET = 160
+
+
+def _snippet(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= MAX_SNIPPET else text[:MAX_SNIPPET - 3] + "..."
+
+
+def _title(movie_id: str, id_lookup: Mapping) -> str:
+    doc = id_lookup.get(movie_id)
+    title = doc.metadata.get("title", "") if doc is not None else ""
+    return title or movie_id
+
+
+def _format_comment(index: ReviewIndex, pos: int, id_lookup: Mapping) -> str:
+    movie_id = index.movie_ids[index.comment_movie[pos]]
+    user = index.user_names[index.comment_user[pos]]
+    return (f"- {_title(movie_id, id_lookup)} — {user}, {format_date(index.comment_date[pos])}: "
+            f"{_snippet(index.comment_text[pos])}")
+
+
+def answer_review_question(q_lower: str, index: ReviewIndex, id_lookup: Mapping) -> Optional[str]:
+    """Answer review questions from the aggregates and inverted index.
+
+    Returns None when the question is not one of the supported review
+    questions, so the caller can fall through to retrieval.
+    """
+    m = TOP_N.search(q_lower)
+    n_text = (m.group(1) or m.group(2)) if m else None
+    n = int(n_text) if n_text else 10
+    if n < 1:
+        return None
+
+    m = MENTIONING.search(q_lower)
+    if m:
+        phrase = m.group(1).strip()
+        total = len(index.matching(phrase))
+        if not total:
+            # Could be a title or phrase the index can't see; let retrieval try
+            return None
+        if WHICH_MOVIES.search(q_lower):
+            lines = [f"- {_title(movie_id, id_lookup)}: {count} reviews"
+                     for movie_id, count in index.movies_mentioning(phrase, n)]
+            return f"Movies with reviews mentioning '{phrase}':\n" + "\n".join(lines)
+        lines = [_format_comment(index, pos, id_lookup) for pos in index.search(phrase, n)]
+        return f"{total} reviews mention '{phrase}'. Latest:\n" + "\n".join(lines)
+
+    unfiltered = all(w in AGGREGATE_WORDS or w == n_text for w in tokenize(q_lower))
+
+    if ACTIVE_USERS.search(q_lower):
+        if not unfiltered:
+            return None
+        rows = index.most_active_users(n)
+        if not rows:
+            return "No reviews in dataset."
+        lines = [f"- {name} ({email}): {count} reviews, latest {format_date(latest)}"
+                 for name, email, count, latest in rows]
+        return "Most active reviewers:\n" + "\n".join(lines)
+
+    if MOST_REVIEWED.search(q_lower):
+        if not unfiltered:
+            return None
+        rows = index.most_reviewed(n)
+        if not rows:
+            return "No reviews in dataset."
+        lines = [f"- {_title(movie_id, id_lookup)}: {count} reviews, latest {format_date(latest)}"
+                 for movie_id, count, latest in rows]
+        return "Most reviewed movies:\n" + "\n".join(lines)
+
+    m = BY_USER.search(q_lower)
+    if m:
+        who = (m.group(1) or m.group(2)).strip()
+        slots = index.find_users(who)
+        if not slots:
+            return None
+        total = sum(index.user_counts[s] for s in slots)
+        lines = [_format_comment(index, pos, id_lookup) for pos in index.reviews_by_user(who, n)]
+        return f"{index.user_names[slots[0]]} wrote {total} reviews. Latest:\n" + "\n".join(lines)
+
+    return None
@@ -4,7 +4,7 @@ import re
 import ast
 import pandas as pd
 import streamlit as st
-from typing import List, Dict, Tuple, Optional
+from typing import List, Mapping, Sequence, Tuple, Optional
 
 load_dotenv()
 
@@ -17,12 +17,26 @@ from langchain.schema import Document
 from langchain_community.chat_models import ChatPerplexity
 from langchain.schema import HumanMessage, SystemMessage
 
+from doc_store import DocumentStore, build_doc_store, load_or_build_vector_index, store_is_stale
+from query_embeddings import CachedQueryEmbeddings
+from theater_index import TheaterIndex, answer_theater_question, load_theater_index
+from review_index import ReviewIndex, answer_review_question, load_review_index, refresh_if_stale
+
 # ----------------------------
 # Config
 # ----------------------------
 CSV_PATH = "movie_full_documents_new.csv"
 INDEX_DIR = "faiss_index_movies"
+STORE_PATH = "movie_docs_store"
+COMPRESS_STORE = True
+THEATERS_CSV = "cleaned_data/theaters_cleaned.csv"
+COMMENTS_CSV = "cleaned_data/comments_cleaned.csv"
+USERS_CSV = "cleaned_data/users_cleaned.csv"
+# How often new comments are pulled from Postgres; 0 runs from the CSVs only
+REVIEWS_REFRESH_SECONDS = float(os.environ.get("REVIEWS_REFRESH_SECONDS", "60"))
 EMB_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+QUERY_CACHE_SIZE = 1024
+QUERY_BATCH_WINDOW = 0.005  # seconds to wait for concurrent queries to batch
 
 HEX24 = re.compile(r"\b[0-9a-f]{24}\b")
 
@@ -59,34 +73,47 @@ Supported question types:
 # ----------------------------
 # Helpers
 # ----------------------------
-def load_documents(csv_path: str) -> Tuple[List[Document], Dict[str, Document]]:
-    df = pd.read_csv(csv_path)
-    docs: List[Document] = []
-    by_id: Dict[str, Document] = {}
-
-    def extract_title(text: str) -> str:
-        m = re.search(r"^Title:\s*(.+)$", text, flags=re.MULTILINE)
-        return m.group(1).strip() if m else ""
-
-    for _, row in df.iterrows():
-        movie_id = str(row["movie_id"])
-        content = str(row["document"])
-        title = extract_title(content)
-        metadata = {"movie_id": movie_id, "title": title}
-        doc = Document(page_content=content, metadata=metadata)
-        docs.append(doc)
-        by_id[movie_id] = doc
-    return docs, by_id
-
-
-def get_or_build_index(docs: List[Document]) -> Tuple[FAISS, HuggingFaceEmbeddings]:
-    embeddings = HuggingFaceEmbeddings(model_name=EMB_MODEL)
-    if os.path.isdir(INDEX_DIR):
-        vs = FAISS.load_local(INDEX_DIR, embeddings, allow_dangerous_deserialization=True)
-    else:
-        vs = FAISS.from_documents(docs, embeddings)
-        vs.save_local(INDEX_DIR)
-    return vs, embeddings
+def load_documents(csv_path: str) -> Tuple[Sequence[Document], DocumentStore]:
+    # Keyed on the CSV's mtime so a regenerated CSV is picked up on the next rerun
+    return open_documents(csv_path, os.path.getmtime(csv_path))
+
+
+@st.cache_resource
+def open_documents(csv_path: str, csv_mtime: float) -> Tuple[Sequence[Document], DocumentStore]:
+    # Page text lives once, in the memory-mapped store; docs and by_id are views
+    if store_is_stale(csv_path, STORE_PATH):
+        build_doc_store(csv_path, STORE_PATH, compress=COMPRESS_STORE)
+    by_id = DocumentStore(STORE_PATH)
+    return by_id.documents(), by_id
+
+
+@st.cache_resource
+def get_embeddings() -> CachedQueryEmbeddings:
+    # Shared across reruns and sessions so the query cache and batcher are too
+    return CachedQueryEmbeddings(
+        HuggingFaceEmbeddings(model_name=EMB_MODEL),
+        max_size=QUERY_CACHE_SIZE,
+        batch_window=QUERY_BATCH_WINDOW,
+    )
+
+
+@st.cache_resource
+def get_or_build_index(_store: DocumentStore, content_hash: str) -> Tuple[FAISS, CachedQueryEmbeddings]:
+    # INDEX_DIR holds only the faiss index, its movie_id order and the hash of
+    # the text it was built from; it is rebuilt when the store's text changes.
+    # Old save_local folders are migrated on first load.
+    embeddings = get_embeddings()
+    return load_or_build_vector_index(INDEX_DIR, embeddings, _store), embeddings
+
+
+@st.cache_resource
+def get_theater_index() -> TheaterIndex:
+    return load_theater_index(THEATERS_CSV)
+
+
+@st.cache_resource
+def get_review_index() -> ReviewIndex:
+    return load_review_index(COMMENTS_CSV, USERS_CSV)
 
 
 def parse_field_from_doc(doc_text: str, field_name: str) -> Optional[str]:
@@ -142,7 +169,8 @@ def build_context(docs: List[Document], max_chars: int = 12000) -> str:
     return "\n\n---\n\n".join(parts)
 
 
-def answer_question(query: str, vs: FAISS, id_lookup: Dict[str, Document], df_csv_path: str, llm: ChatPerplexity) -> str:
+def answer_question(query: str, vs: FAISS, id_lookup: Mapping[str, Document], df_csv_path: str, llm: ChatPerplexity,
+                    theaters: Optional[TheaterIndex] = None, reviews: Optional[ReviewIndex] = None) -> str:
     q_lower = query.lower().strip()
 
     # Deterministic
@@ -169,6 +197,16 @@ def answer_question(query: str, vs: FAISS, id_lookup: Dict[str, Document], df_cs
         resp = llm.invoke(messages)
         return resp.content.strip()
 
+    if reviews is not None:
+        review_answer = answer_review_question(q_lower, reviews, id_lookup)
+        if review_answer:
+            return review_answer
+
+    if theaters is not None:
+        theater_answer = answer_theater_question(q_lower, theaters)
+        if theater_answer:
+            return theater_answer
+
     retriever = vs.as_retriever(search_type="similarity", search_kwargs={"k": 5, "fetch_k": 20})
     retrieved = retriever.get_relevant_documents(query)
     if not retrieved:
@@ -190,7 +228,9 @@ def main():
     # Load docs + FAISS
     with st.spinner("Loading data and building index..."):
         docs, by_id = load_documents(CSV_PATH)
-        vs, _ = get_or_build_index(docs)
+        vs, embeddings = get_or_build_index(by_id, by_id.content_hash)
+        theaters = get_theater_index()
+        reviews = get_review_index()
         llm = build_llm()
 
     #st.success(f"Loaded {len(docs)} movie documents.")
@@ -201,7 +241,10 @@ def main():
         "How many movies are there?",
         "List movies directed by Jing Wong",
         "Who acted in movie id {}".format(docs[0].metadata["movie_id"] if docs else ""),
-        "What is the plot of movie id {}".format(docs[0].metadata["movie_id"] if docs else "")
+        "What is the plot of movie id {}".format(docs[0].metadata["movie_id"] if docs else ""),
+        "Theaters near 40.7,-74.0",
+        "Theaters in Minneapolis",
+        "Top 5 most reviewed movies"
     ]
 
     # Initialize state
@@ -225,9 +268,21 @@ def main():
     # Either manual submit OR auto-submit from quick question
     if (submit_clicked or st.session_state.auto_submit) and user_q:
         with st.spinner("Thinking..."):
-            ans = answer_question(user_q, vs, by_id, CSV_PATH, llm)
+            try:
+                refresh_if_stale(reviews, REVIEWS_REFRESH_SECONDS)
+            except Exception as e:
+                st.warning(f"Could not refresh reviews from the database: {e}")
+            ans = answer_question(user_q, vs, by_id, CSV_PATH, llm, theaters, reviews)
         st.markdown(f"**Q:** {user_q}\n\n**A:** {ans}")
         st.session_state.auto_submit = False  # reset flag
 
+    stats = embeddings.stats()
+    st.sidebar.caption(
+        f"Query cache: {stats['hit_rate']:.0%} hit rate "
+        f"({stats['hits']}/{stats['lookups']}, {stats['joined']} joined a pending encode), "
+        f"avg encode {stats['avg_encode_ms']:.1f} ms, "
+        f"avg batch {stats['avg_batch_size']:.1f}"
+    )
+
 if __name__ == "__main__":
     main()
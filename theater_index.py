@@ -0,0 +1,277 @@
+# theater_index.py
+import ast
+import heapq
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_MILE = 1.609344
+
+
+def to_unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    la, lo = math.radians(lat), math.radians(lon)
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
+
+
+def chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def km_to_chord(km: float) -> float:
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+def _norm(text) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+class TheaterIndex:
+    """KD-tree over theater coordinates plus exact city/state/zip lookups.
+
+    Points are stored as 3D unit vectors, so straight-line (chord) distance
+    ranks theaters the same way great-circle distance does and there is no
+    trouble at the antimeridian. The tree is kept in flat lists: node i holds
+    the point `order[i]` and splits on axis `axes[i]` over the half-open range
+    it was built from.
+    """
+
+    def __init__(self, records: List[dict]):
+        self.records = records
+        self.by_city: Dict[str, List[int]] = {}
+        self.by_state: Dict[str, List[int]] = {}
+        self.by_zip: Dict[str, List[int]] = {}
+
+        points = []
+        for i, r in enumerate(records):
+            self.by_city.setdefault(_norm(r["city"]), []).append(i)
+            self.by_state.setdefault(_norm(r["state"]), []).append(i)
+            self.by_zip.setdefault(str(r["zipcode"]).strip(), []).append(i)
+            if r.get("lat") is not None and r.get("lon") is not None:
+                points.append(i)
+
+        self.vectors = [to_unit_vector(r["lat"], r["lon"]) if r.get("lat") is not None else None
+                        for r in records]
+        self.order: List[int] = points
+        self.axes: List[int] = [0] * len(points)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    # ---- Build ----
+    def _build(self) -> None:
+        # Iterative to stay clear of recursion limits on large catalogs
+        stack = [(0, len(self.order))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= 0:
+                continue
+            # Split on the axis with the largest spread in this range
+            span = []
+            for axis in range(3):
+                vals = [self.vectors[self.order[j]][axis] for j in range(lo, hi)]
+                span.append(max(vals) - min(vals))
+            axis = span.index(max(span))
+            self.order[lo:hi] = sorted(self.order[lo:hi], key=lambda i: self.vectors[i][axis])
+            mid = (lo + hi) // 2
+            self.axes[mid] = axis
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+    # ---- Queries ----
+    def nearest(self, lat: float, lon: float, k: int = 5) -> List[Tuple[dict, float]]:
+        """Return the k closest theaters as (record, distance_km)."""
+        if k <= 0 or not self.order:
+            return []
+        q = to_unit_vector(lat, lon)
+        heap: List[Tuple[float, int]] = []  # max-heap of (-dist2, idx)
+        # Each entry carries a lower bound on squared distance to its range
+        stack = [(0, len(self.order), 0.0)]
+        while stack:
+            lo, hi, bound = stack.pop()
+            if hi <= lo or (len(heap) == k and bound >= -heap[0][0]):
+                continue
+            mid = (lo + hi) // 2
+            idx = self.order[mid]
+            p = self.vectors[idx]
+            d2 = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, idx))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, idx))
+            diff = q[self.axes[mid]] - p[self.axes[mid]]
+            near, far = ((mid + 1, hi), (lo, mid)) if diff > 0 else ((lo, mid), (mid + 1, hi))
+            stack.append(far + (max(bound, diff * diff),))
+            stack.append(near + (bound,))
+        hits = sorted((-d2, idx) for d2, idx in heap)
+        return [(self.records[idx], chord_to_km(math.sqrt(d2))) for d2, idx in hits]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[dict, float]]:
+        """Return every theater within radius_km, closest first."""
+        q = to_unit_vector(lat, lon)
+        r2 = km_to_chord(radius_km) ** 2
+        found: List[Tuple[float, int]] = []
+        stack = [(0, len(self.order))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi <= lo:
+                continue
+            mid = (lo + hi) // 2
+            idx = self.order[mid]
+            p = self.vectors[idx]
+            d2 = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+            if d2 <= r2:
+                found.append((d2, idx))
+            diff = q[self.axes[mid]] - p[self.axes[mid]]
+            if diff <= 0 or diff * diff <= r2:
+                stack.append((lo, mid))
+            if diff >= 0 or diff * diff <= r2:
+                stack.append((mid + 1, hi))
+        found.sort()
+        return [(self.records[idx], chord_to_km(math.sqrt(d2))) for d2, idx in found]
+
+    def in_city(self, city: str, state: Optional[str] = None) -> List[dict]:
+        hits = [self.records[i] for i in self.by_city.get(_norm(city), [])]
+        if state:
+            hits = [r for r in hits if _norm(r["state"]) == _norm(state)]
+        return hits
+
+    def in_state(self, state: str) -> List[dict]:
+        return [self.records[i] for i in self.by_state.get(_norm(state), [])]
+
+    def in_zip(self, zipcode: str) -> List[dict]:
+        return [self.records[i] for i in self.by_zip.get(str(zipcode).strip(), [])]
+
+
+# ----------------------------
+# Loading
+# ----------------------------
+def parse_coordinates(raw) -> Tuple[Optional[float], Optional[float]]:
+    """Theaters store GeoJSON order: "[lon, lat]". Returns (lat, lon)."""
+    if raw is None or (isinstance(raw, float) and math.isnan(raw)):
+        return None, None
+    try:
+        lon, lat = ast.literal_eval(str(raw))
+        return float(lat), float(lon)
+    except Exception:
+        return None, None
+
+
+def records_from_frame(df: pd.DataFrame) -> List[dict]:
+    records = []
+    for _, row in df.iterrows():
+        lat, lon = parse_coordinates(row["location.geo.coordinates"])
+        records.append({
+            "theater_id": str(row["theaterId"]),
+            "street": str(row["location.address.street1"]),
+            "city": str(row["location.address.city"]),
+            "state": str(row["location.address.state"]),
+            "zipcode": str(row["location.address.zipcode"]),
+            "lat": lat,
+            "lon": lon,
+        })
+    return records
+
+
+def load_theater_index(csv_path: str) -> TheaterIndex:
+    df = pd.read_csv(csv_path, dtype={"theaterId": str, "location.address.zipcode": str})
+    return TheaterIndex(records_from_frame(df))
+
+
+def load_theater_index_from_db() -> TheaterIndex:
+    import psycopg2
+    from prepare_doc import db_params, run_query
+
+    conn = psycopg2.connect(**db_params)
+    cur = conn.cursor()
+    df = run_query(cur, """
+    SELECT "theaterId", "location.address.street1", "location.address.city",
+    "location.address.state", "location.address.zipcode", "location.geo.coordinates"
+    FROM theaters;
+    """)
+    cur.close()
+    conn.close()
+    df["location.address.zipcode"] = df["location.address.zipcode"].astype(str)
+    return TheaterIndex(records_from_frame(df))
+
+
+# ----------------------------
+# Question answering
+# ----------------------------
+THEATER_WORD = re.compile(r"\btheat(?:er|re)s?\b")
+COORDS = re.compile(r"(-?\d{1,3}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)")
+RADIUS = re.compile(r"\bwithin\s+(\d+(?:\.\d+)?)\s*(km|kilometers?|kilometres?|mi|miles?)\b")
+TOP_K = re.compile(r"\b(?:nearest|closest|top)\s+(\d+)\b")
+ZIP = re.compile(r"\b(\d{5})\b")
+PLACE = re.compile(r"\b(?:in|at)\s+([a-z][a-z .'-]*?)(?:\s*,\s*([a-z]{2}))?\s*[?.!]*$")
+
+MAX_LISTED = 20
+
+
+def format_theater(r: dict, dist_km: Optional[float] = None) -> str:
+    line = f"- Theater {r['theater_id']}: {r['street']}, {r['city']}, {r['state']} {r['zipcode']}"
+    if dist_km is not None:
+        line += f" ({dist_km:.1f} km)"
+    return line
+
+
+def _format_list(header: str, lines: List[str]) -> str:
+    shown = lines[:MAX_LISTED]
+    if len(lines) > MAX_LISTED:
+        shown.append(f"... and {len(lines) - MAX_LISTED} more")
+    return header + "\n" + "\n".join(shown)
+
+
+def answer_theater_question(q_lower: str, index: TheaterIndex) -> Optional[str]:
+    """Answer theater location questions straight from the index.
+
+    Returns None when the question is not about theater locations, so the
+    caller can fall through to retrieval.
+    """
+    if not THEATER_WORD.search(q_lower):
+        return None
+
+    m = COORDS.search(q_lower)
+    if m:
+        lat, lon = float(m.group(1)), float(m.group(2))
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None
+        r = RADIUS.search(q_lower)
+        if r:
+            radius = float(r.group(1))
+            unit = "km" if r.group(2).startswith("k") else "miles"
+            radius_km = radius if unit == "km" else radius * KM_PER_MILE
+            hits = index.within(lat, lon, radius_km)
+            if not hits:
+                return f"No theaters within {radius:g} {unit} of {lat}, {lon}."
+            return _format_list(f"Theaters within {radius:g} {unit} of {lat}, {lon}:",
+                                [format_theater(t, d) for t, d in hits])
+        k = TOP_K.search(q_lower)
+        hits = index.nearest(lat, lon, int(k.group(1)) if k else 5)
+        return _format_list(f"Nearest theaters to {lat}, {lon}:",
+                            [format_theater(t, d) for t, d in hits])
+
+    z = ZIP.search(q_lower)
+    if z:
+        hits = index.in_zip(z.group(1))
+        if hits:
+            return _format_list(f"Theaters in zip {z.group(1)}:", [format_theater(t) for t in hits])
+        return f"No theaters found in zip {z.group(1)}."
+
+    p = PLACE.search(q_lower)
+    if p:
+        place, state = p.group(1).strip(), p.group(2)
+        hits = index.in_city(place, state)
+        label = f"{place.title()}, {state.upper()}" if state else place.title()
+        if not hits and not state and len(place) == 2:
+            hits = index.in_state(place)
+            label = place.upper()
+        if hits:
+            return _format_list(f"Theaters in {label} ({len(hits)}):", [format_theater(t) for t in hits])
+        # Not a known place ("theaters in the dataset"); leave it to retrieval
+        return None
+
+    return None